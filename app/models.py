@@ -6,7 +6,20 @@ from datetime import datetime
 
 DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root:example@db:3306/streamer")
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# Pool sized for bursty API load; pre-ping + recycle avoid "MySQL server has gone away"
+# after wait_timeout, and LIFO reuse keeps the hottest connections (and their server-side
+# buffers) in play.
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    future=True,
+    pool_size=20,
+    max_overflow=40,
+    pool_recycle=1800,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+    connect_args={"charset": "utf8mb4"},
+)
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 
 Base = declarative_base()
@@ -1,23 +1,99 @@
 import duckdb
+import glob
 import os
 import json
-from datetime import datetime
+import threading
+import time
 from typing import Optional, Dict, Any, List, Tuple
 
+# Optional: orjson decodes the params JSON noticeably faster than stdlib json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 DB_PATH = os.getenv("DUCKDB_PATH", "/data/streamer.duckdb")
+# Connection tuning. Default threads to the CPUs this process may actually run on
+# (respects container cpusets), unlike DuckDB's own host-wide heuristic.
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0")) or (
+    len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+)
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "")  # e.g. "2GB"; empty keeps DuckDB's default
+DUCKDB_WAL_AUTOCHECKPOINT = os.getenv("DUCKDB_WAL_AUTOCHECKPOINT", "64MB")
+DUCKDB_TEMP_DIR = os.getenv("DUCKDB_TEMP_DIR", os.path.join(os.path.dirname(DB_PATH), "duckdb_tmp"))
+
+# One database connection for the process; each thread works through its own cursor
+# (a cheap duplicate connection to the same database), since a DuckDBPyConnection must
+# not be used from several threads at once.
+_root_conn: Optional[duckdb.DuckDBPyConnection] = None
+_root_lock = threading.Lock()
+_tls = threading.local()
+
+# Columnar bulk insert for job logs: each column is bound as one list parameter, so a
+# batch is a single statement instead of one parsed/planned INSERT per row (executemany).
+_INSERT_JOB_LOGS_SQL = (
+    "INSERT INTO job_logs (job_id, seq, ts, line) "
+    "SELECT unnest(?::VARCHAR[]), unnest(?::BIGINT[]), unnest(?::BIGINT[]), unnest(?::VARCHAR[]) "
+    "ON CONFLICT (job_id, seq) DO NOTHING"
+)
 
-_conn: Optional[duckdb.DuckDBPyConnection] = None
+# ON CONFLICT DO UPDATE condition: the incoming row differs from the stored one
+# (summary metrics left out of the upsert keep their value, so don't count as changes)
+_JOB_CHANGED_SQL = """(excluded.status IS DISTINCT FROM status
+    OR excluded.created_at IS DISTINCT FROM created_at
+    OR excluded.started_at IS DISTINCT FROM started_at
+    OR excluded.finished_at IS DISTINCT FROM finished_at
+    OR excluded.exit_code IS DISTINCT FROM exit_code
+    OR excluded.result_path IS DISTINCT FROM result_path
+    OR excluded.error IS DISTINCT FROM error
+    OR excluded.params IS DISTINCT FROM params
+    OR COALESCE(excluded.avg_cores, avg_cores) IS DISTINCT FROM avg_cores
+    OR COALESCE(excluded.avg_mem_bytes, avg_mem_bytes) IS DISTINCT FROM avg_mem_bytes
+    OR COALESCE(excluded.disk_growth_bytes, disk_growth_bytes) IS DISTINCT FROM disk_growth_bytes
+    OR COALESCE(excluded.per_session_cores, per_session_cores) IS DISTINCT FROM per_session_cores
+    OR COALESCE(excluded.per_session_mem_bytes, per_session_mem_bytes) IS DISTINCT FROM per_session_mem_bytes)"""
+
+# Result summary metrics persisted per job once it finishes (filled in by db_sync)
+_SUMMARY_COLUMNS = (
+    ("avg_cores", "DOUBLE"),
+    ("avg_mem_bytes", "BIGINT"),
+    ("disk_growth_bytes", "BIGINT"),
+    ("per_session_cores", "DOUBLE"),
+    ("per_session_mem_bytes", "BIGINT"),
+)
+
+def _get_root_conn():
+    global _root_conn
+    with _root_lock:
+        if _root_conn is None:
+            os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+            config = {
+                "access_mode": "READ_WRITE",
+                "threads": DUCKDB_THREADS,
+                "wal_autocheckpoint": DUCKDB_WAL_AUTOCHECKPOINT,
+                "temp_directory": DUCKDB_TEMP_DIR,
+            }
+            if DUCKDB_MEMORY_LIMIT:
+                config["memory_limit"] = DUCKDB_MEMORY_LIMIT
+            conn = duckdb.connect(DB_PATH, config=config)
+            # reuse row-group metadata across queries instead of re-reading it each time
+            conn.execute("SET enable_object_cache=true")
+            _ensure_schema(conn)
+            _root_conn = conn
+    return _root_conn
 
 def get_conn():
-    global _conn
-    if _conn is None:
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        _conn = duckdb.connect(DB_PATH)
-        _ensure_schema(_conn)
-    return _conn
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = _get_root_conn().cursor()
+        # no progress bar bookkeeping on a server-side connection (per-connection setting)
+        conn.execute("SET enable_progress_bar=false")
+        _tls.conn = conn
+    return conn
 
 def _ensure_schema(conn):
-    # jobs table: store metadata and params as JSON string
+    # jobs table: store metadata and params as native JSON
     conn.execute("""
     CREATE TABLE IF NOT EXISTS jobs (
         id VARCHAR PRIMARY KEY,
@@ -28,10 +104,32 @@ def _ensure_schema(conn):
         exit_code INTEGER,
         result_path VARCHAR,
         error VARCHAR,
-        params VARCHAR,
-        last_updated BIGINT
+        params JSON,
+        last_updated BIGINT,
+        avg_cores DOUBLE,
+        avg_mem_bytes BIGINT,
+        disk_growth_bytes BIGINT,
+        per_session_cores DOUBLE,
+        per_session_mem_bytes BIGINT,
+        version BIGINT DEFAULT 1
     );
     """)
+    # DuckDB's ART indexes don't serve ORDER BY ... LIMIT (get_recent_jobs is a scan +
+    # top-N either way), so an index on created_at only cost writes: drop it where it exists
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_created_at;")
+    # databases created before the summary columns existed: add them
+    existing = {r[0] for r in conn.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'jobs'"
+    ).fetchall()}
+    missing = [(name, sql_type) for name, sql_type in _SUMMARY_COLUMNS if name not in existing]
+    for name, sql_type in missing:
+        conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type};")
+    # per-row change counter (history ETag, see get_jobs_version)
+    if "version" not in existing:
+        conn.execute("ALTER TABLE jobs ADD COLUMN version BIGINT DEFAULT 1;")
+    # Databases created before params was JSON keep a VARCHAR column (DuckDB 0.8 can't
+    # ALTER a column to JSON); JSON is VARCHAR underneath and writes still go through
+    # the same JSON cast in upsert_job, so both behave the same.
     # job_logs: per-line logs persisted with sequence index to avoid duplicates
     conn.execute("""
     CREATE TABLE IF NOT EXISTS job_logs (
@@ -42,105 +140,143 @@ def _ensure_schema(conn):
         PRIMARY KEY (job_id, seq)
     );
     """)
-    # index for faster reads
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_logs_job ON job_logs(job_id);")
+    # the (job_id, seq) primary key already leads on job_id; a separate index only costs writes
+    conn.execute("DROP INDEX IF EXISTS idx_job_logs_job;")
 
 def upsert_job(job: Dict[str, Any]):
     """
     Upsert a job record into the jobs table.
     job keys: id, status, created_at, started_at, finished_at, exit_code, result_path, error, params
+    and optionally the summary metrics (avg_cores, avg_mem_bytes, disk_growth_bytes,
+    per_session_cores, per_session_mem_bytes); metrics left out keep their stored value.
     """
     conn = get_conn()
-    now = int(datetime.utcnow().timestamp())
+    now = int(time.time())
     params = job.get("params")
     if params is not None and not isinstance(params, str):
-        try:
-            params = json.dumps(params)
-        except Exception:
-            params = str(params)
-    # Use delete+insert to emulate upsert (safe single-writer pattern)
-    conn.execute("BEGIN TRANSACTION")
-    try:
-        conn.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
-        conn.execute(
-            "INSERT INTO jobs (id, status, created_at, started_at, finished_at, exit_code, result_path, error, params, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                job.get("id"),
-                job.get("status"),
-                int(job.get("created_at") or 0),
-                int(job.get("started_at") or 0),
-                int(job.get("finished_at") or 0),
-                int(job.get("exit_code")) if job.get("exit_code") not in (None, "") else None,
-                job.get("result_path"),
-                job.get("error"),
-                params,
-                now
-            )
+        params = json.dumps(params, default=str)
+    # Single-statement upsert: one primary-key probe, atomic without an explicit transaction.
+    # last_updated/version only move on a real change, so repeated syncs don't invalidate
+    # history ETags (see get_jobs_version).
+    conn.execute(
+        f"""
+        INSERT INTO jobs (id, status, created_at, started_at, finished_at, exit_code, result_path, error, params, last_updated,
+                          avg_cores, avg_mem_bytes, disk_growth_bytes, per_session_cores, per_session_mem_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(TRY_CAST(? AS JSON), to_json(?)), ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            status = excluded.status,
+            created_at = excluded.created_at,
+            started_at = excluded.started_at,
+            finished_at = excluded.finished_at,
+            exit_code = excluded.exit_code,
+            result_path = excluded.result_path,
+            error = excluded.error,
+            params = excluded.params,
+            last_updated = CASE WHEN {_JOB_CHANGED_SQL} THEN excluded.last_updated ELSE last_updated END,
+            version = CASE WHEN {_JOB_CHANGED_SQL} THEN version + 1 ELSE version END,
+            avg_cores = COALESCE(excluded.avg_cores, avg_cores),
+            avg_mem_bytes = COALESCE(excluded.avg_mem_bytes, avg_mem_bytes),
+            disk_growth_bytes = COALESCE(excluded.disk_growth_bytes, disk_growth_bytes),
+            per_session_cores = COALESCE(excluded.per_session_cores, per_session_cores),
+            per_session_mem_bytes = COALESCE(excluded.per_session_mem_bytes, per_session_mem_bytes)
+        """,
+        (
+            job.get("id"),
+            job.get("status"),
+            int(job.get("created_at") or 0),
+            int(job.get("started_at") or 0),
+            int(job.get("finished_at") or 0),
+            int(job.get("exit_code")) if job.get("exit_code") not in (None, "") else None,
+            job.get("result_path"),
+            job.get("error"),
+            # a params string that isn't valid JSON is kept as a JSON string
+            params,
+            params,
+            now,
+            job.get("avg_cores"),
+            job.get("avg_mem_bytes"),
+            job.get("disk_growth_bytes"),
+            job.get("per_session_cores"),
+            job.get("per_session_mem_bytes")
         )
-        conn.execute("COMMIT")
-    except Exception:
-        conn.execute("ROLLBACK")
-        raise
+    )
 
 def insert_job_logs(job_id: str, rows: List[Tuple[int, int, str]]):
     """
     Insert a batch of log rows for job_id.
     rows: list of tuples (seq, ts, line)
-    This respects the PRIMARY KEY (job_id, seq) and will error on duplicates.
-    We run inside a transaction and ignore duplicate-key errors by filtering beforehand.
+    Returns the number of rows inserted (see insert_job_logs_bulk).
+    """
+    return insert_job_logs_bulk([(job_id, seq, ts, line) for seq, ts, line in rows])
+
+def insert_job_logs_bulk(rows: List[Tuple[str, int, int, str]]):
+    """
+    Insert log rows for any number of jobs.
+    rows: list of tuples (job_id, seq, ts, line)
+    The batch is written with one columnar INSERT; rows whose (job_id, seq) already
+    exist are skipped via ON CONFLICT DO NOTHING. Returns the number of rows inserted.
     """
     if not rows:
         return 0
     conn = get_conn()
-    # Find existing seqs to avoid duplicate insert attempts
-    seqs = [r[0] for r in rows]
-    min_seq = min(seqs)
-    max_seq = max(seqs)
-    # Retrieve already present sequences in range (fast)
-    existing = conn.execute(
-        "SELECT seq FROM job_logs WHERE job_id = ? AND seq BETWEEN ? AND ?",
-        (job_id, min_seq, max_seq)
-    ).fetchall()
-    existing_seqs = {r[0] for r in existing} if existing else set()
-    to_insert = [r for r in rows if r[0] not in existing_seqs]
-    if not to_insert:
-        return 0
-    conn.execute("BEGIN TRANSACTION")
-    try:
-        # Use executemany for batch insert
-        params = [(job_id, seq, ts, line) for (seq, ts, line) in to_insert]
-        conn.executemany("INSERT INTO job_logs (job_id, seq, ts, line) VALUES (?, ?, ?, ?)", params)
-        conn.execute("COMMIT")
-        return len(to_insert)
-    except Exception:
-        conn.execute("ROLLBACK")
-        raise
+    # Duplicates are rejected in-engine by the primary key; a single statement is atomic
+    job_ids, seqs, tss, lines = zip(*rows)
+    res = conn.execute(
+        _INSERT_JOB_LOGS_SQL,
+        (list(job_ids), list(seqs), list(tss), list(lines))
+    ).fetchone()
+    return res[0] if res else 0
 
 def get_recent_jobs(limit: int = 100) -> List[Dict[str, Any]]:
     conn = get_conn()
-    rows = conn.execute("SELECT id, status, created_at, started_at, finished_at, exit_code, result_path, error, params, last_updated FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
-    out = []
-    for r in rows:
-        params = None
-        if r[8]:
+    # Arrow result is materialized columnar and turned into row dicts in one C++ pass
+    out = conn.execute("SELECT id, status, created_at, started_at, finished_at, exit_code, result_path, error, params, last_updated, avg_cores, avg_mem_bytes, disk_growth_bytes, per_session_cores, per_session_mem_bytes FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetch_arrow_table().to_pylist()
+    for job in out:
+        if job["params"]:
             try:
-                params = json.loads(r[8])
+                job["params"] = _json_loads(job["params"])
             except Exception:
-                params = r[8]
-        out.append({
-            "id": r[0],
-            "status": r[1],
-            "created_at": r[2],
-            "started_at": r[3],
-            "finished_at": r[4],
-            "exit_code": r[5],
-            "result_path": r[6],
-            "error": r[7],
-            "params": params,
-            "last_updated": r[9]
-        })
+                pass
     return out
 
+def rebuild_summaries_from_results(results_dir: str) -> int:
+    """
+    Recompute the summary columns of every known job from the simulator result files
+    (bench_result_<job_id>.json) in results_dir. All files are parsed by DuckDB's JSON
+    reader in a single scan; jobs without a result file are left untouched.
+    Bumps last_updated and version of those jobs (history ETag). Returns the number of jobs updated.
+    """
+    pattern = os.path.join(results_dir, "bench_result_*.json")
+    # read_json_auto raises on an empty glob
+    if not glob.glob(pattern):
+        return 0
+    conn = get_conn()
+    # table function arguments can't be bound parameters: inline the glob as a literal
+    pattern = pattern.replace("'", "''")
+    select_cols = ", ".join(f"COALESCE(TRY_CAST(stats.{name} AS {sql_type}), 0) AS {name}"
+                            for name, sql_type in _SUMMARY_COLUMNS)
+    set_cols = ", ".join(f"{name} = r.{name}" for name, _ in _SUMMARY_COLUMNS)
+    res = conn.execute(f"""
+        UPDATE jobs SET {set_cols}, last_updated = ?, version = version + 1
+        FROM (
+            SELECT regexp_extract(filename, 'bench_result_([0-9a-f-]+)\\.json', 1) AS id, {select_cols}
+            FROM read_json_auto('{pattern}', filename=true)
+        ) r
+        WHERE jobs.id = r.id
+    """, (int(time.time()),)).fetchone()
+    return res[0] if res else 0
+
+def get_jobs_version() -> Tuple[int, int, int]:
+    """
+    (max(last_updated), sum(version), row count) of the jobs table. Every real update
+    bumps a row's version, so the last two change whenever a job is added or updated
+    (even within the same second) and can stand in for the history's content in a
+    cache validator; last_updated is only good for Last-Modified.
+    """
+    conn = get_conn()
+    res = conn.execute("SELECT coalesce(max(last_updated), 0), coalesce(sum(version), 0), count(*) FROM jobs").fetchone()
+    return (res[0], int(res[1]), res[2]) if res else (0, 0, 0)
+
 def get_job_by_id(job_id: str) -> Optional[Dict[str, Any]]:
     conn = get_conn()
     try:
@@ -150,7 +286,7 @@ def get_job_by_id(job_id: str) -> Optional[Dict[str, Any]]:
         params = None
         if res[8]:
             try:
-                params = json.loads(res[8])
+                params = _json_loads(res[8])
             except Exception:
                 params = res[8]
         return {
@@ -170,8 +306,4 @@ def get_job_by_id(job_id: str) -> Optional[Dict[str, Any]]:
 
 def get_job_logs(job_id: str, offset: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
     conn = get_conn()
-    rows = conn.execute("SELECT seq, ts, line FROM job_logs WHERE job_id = ? AND seq >= ? ORDER BY seq ASC LIMIT ?", (job_id, offset, limit)).fetchall()
-    out = []
-    for r in rows:
-        out.append({"seq": r[0], "ts": r[1], "line": r[2]})
-    return out
\ No newline at end of file
+    return conn.execute("SELECT seq, ts, line FROM job_logs WHERE job_id = ? AND seq >= ? ORDER BY seq ASC LIMIT ?", (job_id, offset, limit)).fetch_arrow_table().to_pylist()
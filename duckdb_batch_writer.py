@@ -1,11 +1,14 @@
 import asyncio
 import duckdb
 import json
+import os
 import time
+import pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
 
 DB_PATH = "streamer.duckdb"
-BATCH_SIZE = 500
+BATCH_SIZE = int(os.getenv("DUCKDB_BATCH_SIZE", "10000"))
 FLUSH_INTERVAL = 2.0  # seconds
 
 # Example event schema: {
@@ -21,10 +24,12 @@ class DuckDBWriter:
         self._ensure_table()
 
     def _ensure_table(self):
+        # ids come from a sequence so bulk inserts only need to supply the data columns
+        self.conn.execute("CREATE SEQUENCE IF NOT EXISTS events_seq")
         # events table with JSON in a text column (DuckDB can query JSON strings)
         self.conn.execute("""
         CREATE TABLE IF NOT EXISTS events (
-            id BIGINT AUTOINCREMENT PRIMARY KEY,
+            id BIGINT PRIMARY KEY DEFAULT nextval('events_seq'),
             session_id VARCHAR,
             ts DOUBLE,
             type VARCHAR,
@@ -35,13 +40,24 @@ class DuckDBWriter:
     def insert_batch(self, rows: List[Dict[str, Any]]):
         if not rows:
             return
-        # Prepare parameter tuples
-        params = [(r["session_id"], float(r["timestamp"]), r["type"], json.dumps(r.get("payload", {}))) for r in rows]
-        # Use executemany for efficiency
-        self.conn.executemany("INSERT INTO events (session_id, ts, type, payload) VALUES (?, ?, ?, ?)", params)
-        # Optional: checkpoint/flush (DuckDB writes to disk on commit)
+        # Build the batch column-wise as one Arrow table and let DuckDB scan it
+        # through its zero-copy Arrow path in a single INSERT ... SELECT.
+        batch = pa.table(
+            [
+                pa.array([r["session_id"] for r in rows], type=pa.string()),
+                pa.array([float(r["timestamp"]) for r in rows], type=pa.float64()),
+                pa.array([r["type"] for r in rows], type=pa.string()),
+                pa.array([json.dumps(r.get("payload", {})) for r in rows], type=pa.string()),
+            ],
+            names=["session_id", "ts", "type", "payload"]
+        )
+        self.conn.register("_events_buf", batch)
+        try:
+            self.conn.execute("INSERT INTO events (session_id, ts, type, payload) SELECT * FROM _events_buf")
+        finally:
+            self.conn.unregister("_events_buf")
         # conn.commit() not needed in duckdb python API as operations are synchronous
-        return len(params)
+        return len(rows)
 
 async def event_producer(queue: asyncio.Queue):
     # Demo producer that generates events (in real app, workers push to queue)
@@ -60,22 +76,30 @@ async def event_producer(queue: asyncio.Queue):
 async def batched_writer_task(queue: asyncio.Queue, writer: DuckDBWriter):
     buffer: List[Dict[str, Any]] = []
     last_flush = time.time()
+    # DuckDB inserts block for a while on large batches; run them off the event loop on a
+    # single dedicated thread so writes stay serialized on the writer's connection.
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="duckdb-writer")
     while True:
         try:
             # Wait for next item with timeout to allow periodic flush
             evt = await asyncio.wait_for(queue.get(), timeout=FLUSH_INTERVAL)
             buffer.append(evt)
-            # If batch size reached, write now
-            if len(buffer) >= BATCH_SIZE:
-                n = writer.insert_batch(buffer)
+            queue.task_done()
+            # Drain whatever else is already queued so a burst becomes one big insert
+            while not queue.empty() and len(buffer) < BATCH_SIZE:
+                buffer.append(queue.get_nowait())
+                queue.task_done()
+            # If batch size reached (or a steady trickle has been buffering too long), write now
+            if len(buffer) >= BATCH_SIZE or time.time() - last_flush >= FLUSH_INTERVAL:
+                n = await loop.run_in_executor(executor, writer.insert_batch, buffer)
                 print(f"Flushed batch size {n}")
                 buffer.clear()
                 last_flush = time.time()
-            queue.task_done()
         except asyncio.TimeoutError:
             # Timeout -> flush if there are buffered events
             if buffer:
-                n = writer.insert_batch(buffer)
+                n = await loop.run_in_executor(executor, writer.insert_batch, buffer)
                 print(f"Flushed on timeout {n}")
                 buffer.clear()
                 last_flush = time.time()
@@ -14,6 +14,7 @@ You can also run inside the container built by the simulator service:
   docker-compose run --rm simulator python bench_simulator.py --mode http --url https://example.com --concurrency 10 --duration 30
 """
 import argparse
+import array
 import asyncio
 import base64
 import os
@@ -22,7 +23,8 @@ import signal
 import sys
 import time
 import json
-from typing import List, Dict, Any
+from typing import Dict, Any
+import numpy as np
 import psutil
 
 # Optional imports (Playwright)
@@ -34,15 +36,29 @@ except Exception:
 
 import aiohttp
 
+# Optional: orjson serializes the results several times faster than json.dump(indent=2)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ARTIFACTS_DIR = "bench_artifacts"
 
+# Running total of artifact bytes written during the run. Updated by the session workers
+# as they write, so the monitor never has to walk the artifacts dir (asyncio is
+# cooperative, a plain int is enough).
+_disk_bytes = 0
+
 def dir_size_bytes(path: str) -> int:
+    # scandir entries carry the file type from readdir, so only regular files need a stat
     total = 0
-    for root, dirs, files in os.walk(path):
-        for f in files:
-            fp = os.path.join(root, f)
+    with os.scandir(path) as it:
+        for entry in it:
             try:
-                total += os.path.getsize(fp)
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+                elif entry.is_dir(follow_symlinks=False):
+                    total += dir_size_bytes(entry.path)
             except OSError:
                 pass
     return total
@@ -58,6 +74,7 @@ async def http_session_worker(session_id: int, url: str, stop_at: float, think_t
             await asyncio.sleep(think_time)
 
 async def playwright_session_worker(session_id: int, url: str, stop_at: float, screenshot_interval: float):
+    global _disk_bytes
     if not PLAYWRIGHT_AVAILABLE:
         raise RuntimeError("playwright not installed or browsers not set up")
     async with async_playwright() as p:
@@ -79,8 +96,14 @@ async def playwright_session_worker(session_id: int, url: str, stop_at: float, s
                 try:
                     data = await page.screenshot(type="png", full_page=False)
                     fname = os.path.join(ARTIFACTS_DIR, f"sess{session_id}_{int(now)}.png")
+                    # names have 1 s resolution: a shorter interval overwrites the last file
+                    try:
+                        replaced = os.stat(fname).st_size
+                    except FileNotFoundError:
+                        replaced = 0
                     with open(fname, "wb") as fh:
                         fh.write(data)
+                    _disk_bytes += len(data) - replaced
                 except Exception:
                     pass
                 last_ss = now
@@ -91,14 +114,14 @@ async def playwright_session_worker(session_id: int, url: str, stop_at: float, s
         except Exception:
             pass
 
-async def monitor_task(metrics: Dict[str, List[float]], stop_at: float, sample_interval: float, artifacts_dir: str):
+async def monitor_task(metrics: Dict[str, array.array], stop_at: float, sample_interval: float):
     while time.time() < stop_at:
         try:
             percore = psutil.cpu_percent(interval=None, percpu=True)
             total_cpu_percent = sum(percore)
             cores_used = total_cpu_percent / 100.0
             mem = psutil.virtual_memory().used
-            disk = dir_size_bytes(artifacts_dir)
+            disk = _disk_bytes
             metrics["cpu_cores"].append(cores_used)
             metrics["mem_used_bytes"].append(mem)
             metrics["disk_bytes"].append(disk)
@@ -106,12 +129,13 @@ async def monitor_task(metrics: Dict[str, List[float]], stop_at: float, sample_i
             pass
         await asyncio.sleep(sample_interval)
 
-def compute_stats(metrics: Dict[str, List[float]], concurrency: int, duration_seconds: float) -> Dict[str, Any]:
-    def avg(xs):
-        return sum(xs) / len(xs) if xs else 0.0
-    avg_cores = avg(metrics["cpu_cores"])
-    avg_mem = avg(metrics["mem_used_bytes"])
-    disk_growth = (metrics["disk_bytes"][-1] if metrics["disk_bytes"] else 0) - (metrics["disk_bytes"][0] if metrics["disk_bytes"] else 0)
+def compute_stats(metrics: Dict[str, array.array], concurrency: int, duration_seconds: float) -> Dict[str, Any]:
+    cpu = np.asarray(metrics["cpu_cores"], dtype=np.float64)
+    mem = np.asarray(metrics["mem_used_bytes"], dtype=np.float64)
+    disk = np.asarray(metrics["disk_bytes"], dtype=np.int64)
+    avg_cores = float(cpu.mean()) if cpu.size else 0.0
+    avg_mem = float(mem.mean()) if mem.size else 0.0
+    disk_growth = int(disk[-1] - disk[0]) if disk.size else 0
     per_session_cores = avg_cores / max(1, concurrency)
     per_session_mem = avg_mem / max(1, concurrency)
     per_session_disk_per_run = disk_growth / max(1, concurrency)
@@ -148,13 +172,16 @@ def human_bytes(n: int) -> str:
     return f"{n:.1f}PB"
 
 async def run_benchmark(args):
+    global _disk_bytes
     if os.path.exists(ARTIFACTS_DIR):
         shutil.rmtree(ARTIFACTS_DIR)
     os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    _disk_bytes = dir_size_bytes(ARTIFACTS_DIR)
 
     stop_at = time.time() + args.duration
-    metrics = {"cpu_cores": [], "mem_used_bytes": [], "disk_bytes": []}
-    monitor = asyncio.create_task(monitor_task(metrics, stop_at, args.sample_interval, ARTIFACTS_DIR))
+    # typed arrays keep samples unboxed and hand numpy a buffer directly in compute_stats
+    metrics = {"cpu_cores": array.array("d"), "mem_used_bytes": array.array("q"), "disk_bytes": array.array("q")}
+    monitor = asyncio.create_task(monitor_task(metrics, stop_at, args.sample_interval))
 
     workers = []
     if args.mode == "http":
@@ -214,8 +241,12 @@ async def run_benchmark(args):
         print(f"  estimated Disk (for retention policy): {human_bytes(est['estimated_disk_bytes'])}")
 
     out = args.output or "bench_result.json"
-    with open(out, "w") as fh:
-        json.dump(results, fh, indent=2)
+    if orjson is not None:
+        with open(out, "wb") as fh:
+            fh.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+    else:
+        with open(out, "w") as fh:
+            json.dump(results, fh, indent=2)
     print(f"\nRaw results written to {out}")
     return 0
 
@@ -1,12 +1,31 @@
 #!/usr/bin/env python3
 import os
+import io
 import time
 import json
 import shlex
-import subprocess
+import argparse
+import asyncio
+import contextlib
+import threading
 import redis
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+# Optional: orjson encodes straight to bytes and is much faster than stdlib json
+try:
+    import orjson
+    def _json_bytes(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_bytes(obj):
+        return json.dumps(obj).encode()
+
+# Imported once here so the simulator's heavy deps (aiohttp, psutil, numpy, playwright)
+# are already loaded in the warm pool process instead of per job.
+import bench_simulator as sim
+
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
@@ -16,78 +35,196 @@ r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=
 JOB_QUEUE_KEY = "bench_jobs"
 JOB_HASH_PREFIX = "bench_job:"
 JOB_LOG_PREFIX = "bench_job_log:"
+JOB_LOG_COUNT_PREFIX = "bench_job_log_count:"  # total lines ever pushed, survives LTRIM
+
+# Per-job Redis log lists only keep the most recent lines (db_sync persists all of them)
+MAX_LOG_LINES = int(os.getenv("MAX_LOG_LINES", "10000"))
 
-SIMULATOR_SCRIPT = "/simulator/bench_simulator.py"
 SIMULATOR_WORKDIR = "/simulator"
 RESULTS_DIR = os.path.join(SIMULATOR_WORKDIR, "bench_results")
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+# Same default as bench_simulator's --targets
+_DEFAULT_TARGETS = (10, 50, 100, 1000)
+
+# Single reusable process: jobs still run isolated from the worker loop, but without
+# paying interpreter startup + imports for every job.
+_executor = None
+
+# Log lines are buffered briefly and written to Redis in one pipeline per flush
+# (RPUSH of all of a job's lines + one LTRIM + the PUBLISHes) instead of three
+# round-trips per line.
+LOG_FLUSH_INTERVAL = 0.05  # seconds
+LOG_FLUSH_MAX_LINES = 64
+
+def _reset_log_buffer():
+    global _log_lock, _log_flush_lock, _log_buf, _log_pending, _log_flusher
+    _log_lock = threading.Lock()
+    # held from taking the buffer until its pipeline has executed, so flushes from the
+    # flusher thread and from log_line (buffer full) reach Redis in order
+    _log_flush_lock = threading.Lock()
+    _log_buf = []  # (job_id, line)
+    _log_pending = threading.Event()
+    _log_flusher = None
+
+_reset_log_buffer()
+# the pool process is forked: give it its own lock/buffer/flusher thread
+os.register_at_fork(after_in_child=_reset_log_buffer)
+
 def now_ts():
     return int(time.time())
 
-def log_line(job_id, line):
-    key = JOB_LOG_PREFIX + job_id
+def flush_logs():
+    with _log_flush_lock:
+        _flush_logs_locked()
+
+def _flush_logs_locked():
+    with _log_lock:
+        if not _log_buf:
+            return
+        pending = _log_buf[:]
+        _log_buf.clear()
+        _log_pending.clear()
+    by_job = {}
+    for job_id, line in pending:
+        by_job.setdefault(job_id, []).append(line)
     try:
-        # push to persistent job log list
-        r.rpush(key, line)
-        # trim to last 2000 lines
-        r.ltrim(key, -2000, -1)
-        # publish to realtime pubsub channel for streaming to web clients
-        payload = json.dumps({"job_id": job_id, "line": line})
-        r.publish("bench_logs", payload)
+        # MULTI/EXEC: db_sync must never see a list length and line count from different flushes
+        pipe = r.pipeline()
+        for job_id, lines in by_job.items():
+            key = JOB_LOG_PREFIX + job_id
+            # push to persistent job log list, trimmed to last MAX_LOG_LINES lines;
+            # the running count lets db_sync map list indices to absolute line numbers
+            pipe.rpush(key, *lines)
+            pipe.ltrim(key, -MAX_LOG_LINES, -1)
+            pipe.incrby(JOB_LOG_COUNT_PREFIX + job_id, len(lines))
+            # publish to realtime pubsub channel for streaming to web clients;
+            # payload is {"job_id": ..., "line": ...} assembled around a per-job prefix
+            prefix = b'{"job_id":' + _json_bytes(job_id) + b',"line":'
+            for line in lines:
+                pipe.publish("bench_logs", prefix + _json_bytes(line) + b'}')
+        pipe.execute()
     except Exception:
         # best-effort logging; avoid raising in log path
         pass
 
+def _log_flush_loop():
+    while True:
+        _log_pending.wait()
+        # let a burst accumulate before flushing
+        time.sleep(LOG_FLUSH_INTERVAL)
+        flush_logs()
+
+def log_line(job_id, line):
+    global _log_flusher
+    with _log_lock:
+        _log_buf.append((job_id, line))
+        full = len(_log_buf) >= LOG_FLUSH_MAX_LINES
+        _log_pending.set()
+        if _log_flusher is None:
+            _log_flusher = threading.Thread(target=_log_flush_loop, daemon=True)
+            _log_flusher.start()
+    if full:
+        flush_logs()
+
 def set_job_field(job_id, field, value):
     key = JOB_HASH_PREFIX + job_id
     r.hset(key, field, value)
 
+class _JobLogStream(io.TextIOBase):
+    """
+    File-like sink for the simulator's stdout/stderr inside the pool process:
+    every complete line is forwarded to log_line for the job.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._partial = []  # fragments of the current, not yet terminated line
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        # split only the new chunk; earlier fragments are never re-scanned or re-copied
+        lines = s.split("\n")
+        if len(lines) > 1:
+            self._partial.append(lines[0])
+            log_line(self.job_id, "".join(self._partial))
+            for line in lines[1:-1]:
+                log_line(self.job_id, line)
+            self._partial = [lines[-1]] if lines[-1] else []
+        elif s:
+            self._partial.append(s)
+        return len(s)
+
+    def close(self):
+        if self._partial:
+            log_line(self.job_id, "".join(self._partial))
+            self._partial = []
+        # don't leave lines sitting in the buffer once the job is over
+        flush_logs()
+        super().close()
+
+def _pool_init():
+    # bench_simulator writes its artifacts relative to the cwd
+    os.chdir(SIMULATOR_WORKDIR)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1, initializer=_pool_init)
+    return _executor
+
+def _run_simulation(job_id, args):
+    """Runs in the pool process; returns the simulator's exit code."""
+    stream = _JobLogStream(job_id)
+    try:
+        with contextlib.redirect_stdout(stream), contextlib.redirect_stderr(stream):
+            return asyncio.run(sim.run_benchmark(args)) or 0
+    finally:
+        stream.close()
+
+def _build_args(params, out_path):
+    targets = params.get("targets") or _DEFAULT_TARGETS
+    if not isinstance(targets, (list, tuple)):
+        targets = [targets]
+    return argparse.Namespace(
+        mode=str(params.get("mode", "http")),
+        url=str(params.get("url")),
+        concurrency=int(params.get("concurrency", 5)),
+        duration=int(params.get("duration", 30)),
+        sample_interval=float(params.get("sample_interval", 1.0)),
+        think_time=float(params.get("think_time", 1.0)),
+        screenshot_interval=float(params.get("screenshot_interval", 2.0)),
+        targets=[int(t) for t in targets],
+        output=out_path,
+        safety_factor=float(params.get("safety_factor", 1.5)),
+        baseline_os_mem_bytes=int(params.get("baseline_os_mem_bytes", 536870912)),
+        retention_days=int(params.get("retention_days", 7)),
+        runs_per_day=int(params.get("runs_per_day", 24))
+    )
+
 def process_job(job_item):
+    global _executor
     job_id = job_item.get("id")
     params = job_item.get("params", {})
-    job_key = JOB_HASH_PREFIX + job_id
 
     # mark started
     set_job_field(job_id, "status", "running")
     set_job_field(job_id, "started_at", now_ts())
 
     # Prepare output path for simulator to write
-    out_fname = f"bench_result_{job_id}.json"
-    out_path = os.path.join(RESULTS_DIR, out_fname)
-    # Build command
-    cmd = ["python3", SIMULATOR_SCRIPT,
-           "--mode", str(params.get("mode", "http")),
-           "--url", str(params.get("url")),
-           "--concurrency", str(params.get("concurrency", 5)),
-           "--duration", str(params.get("duration", 30)),
-           "--sample-interval", str(params.get("sample_interval", 1.0)),
-           "--think-time", str(params.get("think_time", 1.0)),
-           "--screenshot-interval", str(params.get("screenshot_interval", 2.0)),
-           "--output", out_path,
-           "--safety-factor", str(params.get("safety_factor", 1.5)),
-           "--baseline-os-mem-bytes", str(params.get("baseline_os_mem_bytes", 536870912)),
-           "--retention-days", str(params.get("retention_days", 7)),
-           "--runs-per-day", str(params.get("runs_per_day", 24))
-    ]
-    targets = params.get("targets", [])
-    if isinstance(targets, (list, tuple)):
-        for t in targets:
-            cmd.extend(["--targets", str(t)])
-    elif targets:
-        cmd.extend(["--targets", str(targets)])
+    out_path = f"{RESULTS_DIR}/bench_result_{job_id}.json"
 
     try:
-        # Start subprocess, capture stdout/stderr merged
-        proc = subprocess.Popen(cmd, cwd=SIMULATOR_WORKDIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        # Stream lines to Redis list and publish them for realtime clients
-        for line in iter(proc.stdout.readline, ""):
-            if not line:
-                break
-            line = line.rstrip("\n")
-            log_line(job_id, line)
-        proc.wait()
-        exit_code = proc.returncode
+        args = _build_args(params, out_path)
+        # Run the simulator in the warm pool process; its output is streamed to
+        # the Redis job log from inside the child
+        try:
+            exit_code = _get_executor().submit(_run_simulation, job_id, args).result()
+        except BrokenProcessPool:
+            # child died (e.g. OOM); start a fresh pool for the next job
+            _executor = None
+            raise
         set_job_field(job_id, "exit_code", str(exit_code))
         if exit_code == 0:
             set_job_field(job_id, "status", "completed")
@@ -0,0 +1,92 @@
+"""
+db_sync log ingestion against a capped (LTRIMmed) Redis log list, with fakeredis standing
+in for Redis and DuckDB writes captured in memory.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("fakeredis.aioredis")
+pytest.importorskip("lupa")  # fakeredis needs it for EVAL
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "web")]
+os.environ.setdefault("DUCKDB_PATH", os.path.join(ROOT, ".pytest_cache", "db_sync_test.duckdb"))
+
+import db_sync  # noqa: E402
+
+CAP = 100
+JOB_ID = "job-1"
+
+
+@pytest.fixture
+def redis_pair(monkeypatch):
+    server = fakeredis.FakeServer()
+    sync_r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    async_r = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(db_sync, "_r", async_r)
+    monkeypatch.setattr(db_sync, "_READ_LOG_SCRIPT", async_r.register_script(db_sync._READ_LOG_SCRIPT.script))
+    monkeypatch.setattr(db_sync, "_summarized", set())
+    monkeypatch.setattr(db_sync, "upsert_job", lambda record: None)
+    rows = []
+    monkeypatch.setattr(db_sync, "insert_job_logs_bulk", rows.extend)
+    sync_r.hset(db_sync.JOB_HASH_PREFIX + JOB_ID, mapping={"status": "running", "created_at": "1"})
+    sync_r.sadd(db_sync.JOB_INDEX_KEY, JOB_ID)
+    return sync_r, rows
+
+
+def _flush(r, start, count):
+    # same writes as simulator/worker.py flush_logs
+    key = db_sync.JOB_LOG_PREFIX + JOB_ID
+    pipe = r.pipeline()
+    pipe.rpush(key, *(f"line{i}" for i in range(start, start + count)))
+    pipe.ltrim(key, -CAP, -1)
+    pipe.incrby(db_sync.JOB_LOG_COUNT_PREFIX + JOB_ID, count)
+    pipe.execute()
+
+
+def test_seq_matches_line_when_list_is_trimmed_mid_sync(redis_pair, monkeypatch):
+    r, rows = redis_pair
+    _flush(r, 0, 150)
+    r.set(db_sync.JOB_LOG_SYNC_PREFIX + JOB_ID, "120")
+
+    # a worker flush lands while the DuckDB upsert runs, shifting the list indices
+    upsert_jobs = db_sync._upsert_jobs
+
+    def upsert_with_flush(*args):
+        _flush(r, 150, 10)
+        return upsert_jobs(*args)
+
+    monkeypatch.setattr(db_sync, "_upsert_jobs", upsert_with_flush)
+    asyncio.run(db_sync._sync_jobs([JOB_ID]))
+    monkeypatch.setattr(db_sync, "_upsert_jobs", upsert_jobs)
+    asyncio.run(db_sync._sync_jobs([JOB_ID]))
+
+    assert [(seq, line) for _, seq, _, line in rows] == [(i, f"line{i}") for i in range(120, 160)]
+    assert r.get(db_sync.JOB_LOG_SYNC_PREFIX + JOB_ID) == "160"
+
+
+def test_lines_trimmed_before_sync_are_skipped(redis_pair):
+    r, rows = redis_pair
+    _flush(r, 0, 30)
+    asyncio.run(db_sync._sync_jobs([JOB_ID]))
+    _flush(r, 30, 150)  # lines 30..79 are trimmed before the next sync
+    asyncio.run(db_sync._sync_jobs([JOB_ID]))
+
+    seqs = [seq for _, seq, _, _ in rows]
+    assert seqs == list(range(30)) + list(range(80, 180))
+    assert all(line == f"line{seq}" for _, seq, _, line in rows)
+
+
+def test_log_only_changes_skip_the_job_upsert(redis_pair, monkeypatch):
+    r, rows = redis_pair
+    upserted = []
+    monkeypatch.setattr(db_sync, "upsert_job", lambda record: upserted.append(record["id"]))
+    _flush(r, 0, 5)
+    asyncio.run(db_sync._sync_jobs([JOB_ID], changed=set()))
+    assert upserted == [] and len(rows) == 5
+    asyncio.run(db_sync._sync_jobs([JOB_ID], changed={JOB_ID}))
+    assert upserted == [JOB_ID]
@@ -1,73 +1,117 @@
 # Full web app including the new /api/bench/history enhancement that includes inline metrics
 import os
 import uuid
-import json
-from flask import Flask, request, jsonify, send_from_directory, send_file
+import threading
+import orjson
+import msgspec
+from collections import deque
+from typing import List, Union
+from flask import Flask, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room
 from dotenv import load_dotenv
-from bench_runner import start_job, get_job
+from bench_runner import start_job, get_job, LOG_TAIL_DEFAULT, RESULTS_DIR
 from log_listener import register_emit_callback, start_redis_listener
 from db_sync import start_db_sync
-from db.duckdb_client import get_recent_jobs, get_job_logs, get_job_by_id
+from db.duckdb_client import get_recent_jobs, get_job_logs, get_job_by_id, get_jobs_version, rebuild_summaries_from_results
 
 load_dotenv()
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "dev-secret")
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.json)."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 # Use eventlet for Socket.IO server
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
 
+# Log lines from the Redis listener thread are queued here and flushed to clients in
+# batches (one "bench_log_batch" emit per job every LOG_EMIT_INTERVAL) instead of one
+# Socket.IO frame per line. Under overload the oldest queued lines are dropped.
+LOG_EMIT_INTERVAL = float(os.getenv("LOG_EMIT_INTERVAL", "0.02"))  # seconds
+LOG_EMIT_MAX_PENDING = int(os.getenv("LOG_EMIT_MAX_PENDING", "10000"))
+_log_pending = deque(maxlen=LOG_EMIT_MAX_PENDING)
+_log_pending_lock = threading.Lock()
+
 # Start Redis listener and DB sync; register emit callback to forward logs via Socket.IO
 def _emit_to_socketio(job_id, line):
-    room = f"bench_job:{job_id}"
-    socketio.emit("bench_log", {"job_id": job_id, "line": line}, room=room)
+    with _log_pending_lock:
+        _log_pending.append((job_id, line))
+
+def _flush_log_batches():
+    while True:
+        socketio.sleep(LOG_EMIT_INTERVAL)
+        if not _log_pending:
+            continue
+        with _log_pending_lock:
+            pending = list(_log_pending)
+            _log_pending.clear()
+        by_job = {}
+        for job_id, line in pending:
+            by_job.setdefault(job_id, []).append(line)
+        for job_id, lines in by_job.items():
+            socketio.emit("bench_log_batch", {"job_id": job_id, "lines": lines}, room=f"bench_job:{job_id}")
 
 register_emit_callback(_emit_to_socketio)
+socketio.start_background_task(_flush_log_batches)
 start_redis_listener()
 start_db_sync()
 
 SESSIONS = {}
 
-@app.route("/")
-def index():
-    return send_from_directory(app.static_folder, "index.html")
-
-@app.route("/bench")
-def bench_ui():
-    return send_from_directory(app.static_folder, "benchmark.html")
-
-@app.route("/bench/history")
-def bench_history_ui():
-    return send_from_directory(app.static_folder, "history.html")
+# UI pages (/, /bench, /bench/history) and /static/ are served by nginx (nginx/default.conf)
+
+# int fields also take floats (e.g. 3.0) and truncate them like int() did before
+_Int = Union[int, float]
+_INT_FIELDS = ("concurrency", "duration", "baseline_os_mem_bytes", "retention_days", "runs_per_day")
+
+class BenchParams(msgspec.Struct):
+    """Body of /api/bench/start; mode, url, concurrency and duration are required."""
+    mode: str
+    url: str
+    concurrency: _Int
+    duration: _Int
+    sample_interval: float = 1.0
+    think_time: float = 1.0
+    screenshot_interval: float = 2.0
+    targets: List[_Int] = msgspec.field(default_factory=lambda: [10, 50, 100, 1000])
+    safety_factor: float = 1.5
+    baseline_os_mem_bytes: _Int = 512 * 1024 * 1024
+    retention_days: _Int = 7
+    runs_per_day: _Int = 24
+
+    def __post_init__(self):
+        try:
+            for name in _INT_FIELDS:
+                setattr(self, name, int(getattr(self, name)))
+            self.targets = [int(t) for t in self.targets]
+        except OverflowError:
+            # inf: msgspec reports ValueError as a validation error
+            raise ValueError("integer fields must be finite")
 
 @app.route("/api/bench/start", methods=["POST"])
 def api_bench_start():
-    payload = request.json or {}
-    required = ["mode", "url", "concurrency", "duration"]
-    for r in required:
-        if r not in payload:
-            return jsonify({"error": f"{r} is required"}), 400
-    params = {
-        "mode": payload.get("mode", "http"),
-        "url": payload.get("url"),
-        "concurrency": int(payload.get("concurrency", 5)),
-        "duration": int(payload.get("duration", 30)),
-        "sample_interval": float(payload.get("sample_interval", 1.0)),
-        "think_time": float(payload.get("think_time", 1.0)),
-        "screenshot_interval": float(payload.get("screenshot_interval", 2.0)),
-        "targets": payload.get("targets", [10,50,100,1000]),
-        "safety_factor": float(payload.get("safety_factor", 1.5)),
-        "baseline_os_mem_bytes": int(payload.get("baseline_os_mem_bytes", 512 * 1024 * 1024)),
-        "retention_days": int(payload.get("retention_days", 7)),
-        "runs_per_day": int(payload.get("runs_per_day", 24))
-    }
-    job_id = start_job(params)
+    # decode + validate + coerce the body in one pass; strict=False accepts numeric strings
+    try:
+        params = msgspec.json.decode(request.get_data(), type=BenchParams, strict=False)
+    except msgspec.ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except msgspec.DecodeError:
+        return jsonify({"error": "invalid JSON body"}), 400
+    job_id = start_job(msgspec.to_builtins(params))
     return jsonify({"job_id": job_id}), 202
 
 @app.route("/api/bench/status/<job_id>", methods=["GET"])
 def api_bench_status(job_id):
-    job = get_job(job_id)
+    job = get_job(job_id, tail=request.args.get("tail", LOG_TAIL_DEFAULT, type=int))
     if not job:
         return jsonify({"error": "not found"}), 404
     return jsonify(job)
@@ -82,71 +126,31 @@ def api_bench_result(job_id):
         return jsonify({"error": "result not available"}), 404
     return send_file(result_path, mimetype="application/json", as_attachment=True, download_name=f"bench_result_{job_id}.json")
 
+_BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
 def _human_bytes(n):
     try:
         n = int(n)
     except Exception:
         return "-"
-    for unit in ['B','KB','MB','GB','TB']:
-        if n < 1024:
-            return f"{n:.1f}{unit}"
-        n /= 1024.0
-    return f"{n:.1f}PB"
+    if n < 1024:
+        return f"{n:.1f}B"
+    # unit index straight from the magnitude instead of dividing in a loop
+    i = min((n.bit_length() - 1) // 10, 5)
+    return f"{n / (1 << (10 * i)):.1f}{_BYTE_UNITS[i]}"
 
-def _load_summary_from_result_path(result_path):
+def _summary_from_job(job):
     """
-    Try to load the simulator result JSON and extract key metrics for inline display.
-    Returns a dict (may be empty on failure).
-    Expected structure in result JSON:
-      {
-        "stats": {
-          "avg_cores": ...,
-          "avg_mem_bytes": ...,
-          "disk_growth_bytes": ...,
-          "per_session_cores": ...,
-          "per_session_mem_bytes": ...,
-          ...
-        },
-        "estimates": {...}
-      }
+    Build the inline history summary from the metrics db_sync stored with the job
+    (parsed once from the result JSON when the job finished). None if not available.
     """
-    if not result_path or not os.path.exists(result_path):
-        return None
-    try:
-        with open(result_path, "r") as fh:
-            data = json.load(fh)
-    except Exception:
+    if job.get("avg_cores") is None:
         return None
-    stats = data.get("stats") or data.get("stats", {})
-    if not stats and "stats" in data:
-        stats = data["stats"]
-    # tolerate nested structure used earlier (top-level "stats")
-    s = data.get("stats", {}) if isinstance(data.get("stats", {}), dict) else {}
-    # fallback: if top-level keys present
-    s = s or data.get("stats", {}) or {}
-    # Some simulator variants put stats at data["stats"]
-    stats = data.get("stats", {}) or stats or {}
-    # Build summary
-    try:
-        avg_cores = float(stats.get("avg_cores") or 0.0)
-    except Exception:
-        avg_cores = 0.0
-    try:
-        avg_mem = int(stats.get("avg_mem_bytes") or 0)
-    except Exception:
-        avg_mem = 0
-    try:
-        disk_growth = int(stats.get("disk_growth_bytes") or 0)
-    except Exception:
-        disk_growth = 0
-    try:
-        per_session_cores = float(stats.get("per_session_cores") or 0.0)
-    except Exception:
-        per_session_cores = 0.0
-    try:
-        per_session_mem = int(stats.get("per_session_mem_bytes") or 0)
-    except Exception:
-        per_session_mem = 0
+    avg_cores = float(job.get("avg_cores") or 0.0)
+    avg_mem = int(job.get("avg_mem_bytes") or 0)
+    disk_growth = int(job.get("disk_growth_bytes") or 0)
+    per_session_cores = float(job.get("per_session_cores") or 0.0)
+    per_session_mem = int(job.get("per_session_mem_bytes") or 0)
     return {
         "avg_cores": avg_cores,
         "avg_cores_str": f"{avg_cores:.3f}",
@@ -164,13 +168,31 @@ def _load_summary_from_result_path(result_path):
 @app.route("/api/bench/history", methods=["GET"])
 def api_bench_history():
     limit = int(request.args.get("limit", 100))
-    jobs = get_recent_jobs(limit=limit)
-    # Augment each job with inline summary (if result file available)
-    for job in jobs:
-        result_path = job.get("result_path")
-        summary = _load_summary_from_result_path(result_path) if result_path else None
-        job["summary"] = summary
-    return jsonify({"jobs": jobs})
+    # Conditional GET: pollers get a bodyless 304 until some job row changes
+    last_updated, version, count = get_jobs_version()
+    etag = f"{version}-{count}-{limit}"
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        jobs = get_recent_jobs(limit=limit)
+        # Inline summary comes straight from the persisted metric columns
+        for job in jobs:
+            job["summary"] = _summary_from_job(job)
+        resp = jsonify({"jobs": jobs})
+    resp.set_etag(etag, weak=True)
+    resp.last_modified = last_updated or None
+    resp.headers["Cache-Control"] = "private, max-age=1"
+    return resp
+
+# Admin: recompute every job's summary columns from the result files in one DuckDB scan
+# (backfill, or after the files were regenerated)
+@app.route("/api/bench/rebuild_history", methods=["POST"])
+def api_bench_rebuild_history():
+    try:
+        updated = rebuild_summaries_from_results(RESULTS_DIR)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"updated": updated})
 
 # New: fetch persisted logs from DuckDB
 @app.route("/api/bench/logs/<job_id>", methods=["GET"])
@@ -1,22 +1,30 @@
 import os
 import uuid
 import time
-import json
-import redis
+import orjson
+from redis_pool import get_redis
 
 # Redis-based job queue for benchmark runs.
-REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_DB = int(os.getenv("REDIS_DB", 0))
-
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+r = get_redis()
 
 JOB_QUEUE_KEY = "bench_jobs"             # list of job JSONs
 JOB_HASH_PREFIX = "bench_job:"           # hash per job id: bench_job:<id>
 JOB_LOG_PREFIX = "bench_job_log:"        # list per job id: bench_job_log:<id>
+LOG_TAIL_DEFAULT = 500                   # log lines returned by get_job unless asked otherwise
+JOB_INDEX_KEY = "bench_job_index"        # set of job ids db_sync still has to sync
 
 RESULTS_DIR = "/simulator/bench_results"  # workers write results here
 
+# Atomically store the job hash, index it and enqueue it in a single round-trip, so a
+# worker can never pop a job whose metadata isn't visible yet.
+# KEYS: job hash, job queue, job index; ARGV: queue item, job id, hash field/value pairs...
+_START_JOB_SCRIPT = r.register_script("""
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('SADD', KEYS[3], ARGV[2])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+return 1
+""")
+
 def _now_ts():
     return int(time.time())
 
@@ -38,18 +46,20 @@ def start_job(params: dict) -> str:
         "exit_code": "",
         "result_path": "",
         "error": "",
-        "params": json.dumps(params)
+        "params": orjson.dumps(params).decode()
     }
-    r.hset(job_key, mapping=job_meta)
     # Push to queue: store the job id and params as JSON
     queue_item = {
         "id": job_id,
         "params": params
     }
-    r.rpush(JOB_QUEUE_KEY, json.dumps(queue_item))
+    # Hash + index for db_sync (it removes finished jobs once they're persisted) + queue
+    fields = [x for kv in job_meta.items() for x in kv]
+    _START_JOB_SCRIPT(keys=[job_key, JOB_QUEUE_KEY, JOB_INDEX_KEY],
+                      args=[orjson.dumps(queue_item), job_id, *fields])
     return job_id
 
-def get_job(job_id: str):
+def get_job(job_id: str, tail: int = LOG_TAIL_DEFAULT):
     job_key = JOB_HASH_PREFIX + job_id
     if not r.exists(job_key):
         return None
@@ -57,19 +67,19 @@ def get_job(job_id: str):
     # parse params if present
     if meta.get("params"):
         try:
-            meta["params"] = json.loads(meta["params"])
+            meta["params"] = orjson.loads(meta["params"])
         except Exception:
             pass
-    # fetch logs (last N lines)
+    # fetch logs (last `tail` lines only; the list itself is capped by the worker)
     log_key = JOB_LOG_PREFIX + job_id
-    logs = r.lrange(log_key, 0, -1) if r.exists(log_key) else []
+    logs = r.lrange(log_key, -tail, -1) if tail > 0 else []
     # Attempt to load result JSON if result_path exists and accessible
     result = None
     result_path = meta.get("result_path")
     if result_path and os.path.exists(result_path):
         try:
-            with open(result_path, "r") as fh:
-                result = json.load(fh)
+            with open(result_path, "rb") as fh:
+                result = orjson.loads(fh.read())
         except Exception:
             result = None
     meta["log"] = logs
@@ -78,6 +88,5 @@ def get_job(job_id: str):
     return meta
 
 def list_jobs():
-    # Simple scan by key pattern (not ideal at scale)
-    keys = r.keys(JOB_HASH_PREFIX + "*")
-    return [k.replace(JOB_HASH_PREFIX, "") for k in keys]
\ No newline at end of file
+    # Incremental SCAN instead of KEYS, so Redis is never blocked for the whole keyspace
+    return [k[len(JOB_HASH_PREFIX):] for k in r.scan_iter(match=JOB_HASH_PREFIX + "*", count=1000)]
\ No newline at end of file
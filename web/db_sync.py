@@ -1,130 +1,340 @@
 """
-Background synchronizer: periodically scans Redis job hashes and upserts them into DuckDB,
-and also ingests newly appended per-job log lines from Redis lists into the DuckDB job_logs table.
+Background synchronizer: upserts Redis job hashes into DuckDB, and also ingests newly
+appended per-job log lines from Redis lists into the DuckDB job_logs table.
+
+Syncs are event driven: Redis keyspace notifications for bench_job:* / bench_job_log:*
+tell us which jobs changed, and only those are synced. A full pass over the job index
+still runs every DB_SYNC_FULL_INTERVAL seconds as a safety net, and the loop falls back
+to polling every DB_SYNC_INTERVAL if notifications can't be enabled on the server.
+It all runs as one coroutine on the shared Redis event loop (see redis_loop); DuckDB
+writes are handed to worker threads so Redis I/O keeps going meanwhile.
 
 Sync strategy for logs:
 - Worker pushes lines to Redis list JOB_LOG_PREFIX + job_id.
-- We keep a per-job Redis key JOB_LOG_SYNC_PREFIX + job_id storing the next list index to read.
-- On each sync iteration we LRANGE from last_index to -1 to get new entries, then insert them into DuckDB with sequence numbers matching Redis list indices.
+- The worker caps each list with LTRIM and counts every pushed line in JOB_LOG_COUNT_PREFIX + job_id,
+  so count - LLEN is the number of lines trimmed off the front.
+- We keep a per-job Redis key JOB_LOG_SYNC_PREFIX + job_id storing the next line number to read.
+- On each sync iteration a Lua script reads the count, LLEN and the lines from that line number onwards
+  in one atomic step (a worker flush in between would shift the list), and we insert them into DuckDB
+  with sequence numbers that are absolute line numbers (stable across trims).
+
+Redis access is batched across jobs: one pipeline reads every job's hash and sync pointer,
+one pipeline runs the log-range script for every job, and one writes the advanced
+pointers back, regardless of how many jobs are being synced.
 """
 import os
 import time
-import threading
-import json
-import redis
-from db.duckdb_client import upsert_job, insert_job_logs
-
-REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_DB = int(os.getenv("REDIS_DB", 0))
+import asyncio
+import ijson
+import orjson
+from redis_pool import REDIS_DB
+from redis_loop import get_async_redis, submit
+from db.duckdb_client import upsert_job, insert_job_logs_bulk
 
 JOB_HASH_PREFIX = "bench_job:"
 JOB_LOG_PREFIX = "bench_job_log:"
 JOB_LOG_SYNC_PREFIX = "bench_job_log_sync:"
+JOB_LOG_COUNT_PREFIX = "bench_job_log_count:"
+JOB_INDEX_KEY = "bench_job_index"        # set of job ids still to be synced (see bench_runner)
+
+TERMINAL_STATUSES = ("completed", "failed")
+# keep syncing a finished job this long, so lines the worker logs right after the
+# final status update still reach DuckDB before the job leaves the index
+JOB_INDEX_GRACE = int(os.getenv("DB_SYNC_INDEX_GRACE", "30"))  # seconds
 
 SYNC_INTERVAL = float(os.getenv("DB_SYNC_INTERVAL", "1.0"))  # seconds
+FULL_SYNC_INTERVAL = float(os.getenv("DB_SYNC_FULL_INTERVAL", "30.0"))  # seconds
 LOG_BATCH_LIMIT = int(os.getenv("DB_LOG_BATCH_LIMIT", "1000"))
+# max jobs per pipelined batch (keeps server-side reply buffers bounded)
+PIPELINE_CHUNK = int(os.getenv("DB_SYNC_PIPELINE_CHUNK", "10000"))
 
-_r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+_r = get_async_redis()
 
-_thread = None
+# Atomically read a job's new log lines. KEYS: log list, line count; ARGV: next line
+# number to read, max lines. Returns {total lines ever pushed, line number of the first
+# returned line, lines}; lines trimmed off before we read them are skipped.
+_READ_LOG_SCRIPT = _r.register_script("""
+local llen = redis.call('LLEN', KEYS[1])
+local total = tonumber(redis.call('GET', KEYS[2])) or llen
+local trimmed = math.max(total - llen, 0)
+local start = math.max(tonumber(ARGV[1]), trimmed)
+if start >= total then
+    return {total, start, {}}
+end
+local first = start - trimmed
+local last = math.min(llen, first + tonumber(ARGV[2])) - 1
+return {total, start, redis.call('LRANGE', KEYS[1], first, last)}
+""")
+
+_future = None
 _running = False
+# finished jobs whose result summary has already been stored this process
+_summarized = set()
 
 def _now_ts():
     return int(time.time())
 
-def _sync_jobs_and_logs_once():
-    try:
-        keys = _r.keys(JOB_HASH_PREFIX + "*")
-        for k in keys:
-            try:
-                meta = _r.hgetall(k)
-                if not meta:
-                    continue
-                job_id = k.replace(JOB_HASH_PREFIX, "")
-                params = None
-                if meta.get("params"):
-                    try:
-                        params = json.loads(meta.get("params"))
-                    except Exception:
-                        params = meta.get("params")
-                job_record = {
-                    "id": job_id,
-                    "status": meta.get("status"),
-                    "created_at": int(meta.get("created_at")) if meta.get("created_at") else None,
-                    "started_at": int(meta.get("started_at")) if meta.get("started_at") else None,
-                    "finished_at": int(meta.get("finished_at")) if meta.get("finished_at") else None,
-                    "exit_code": int(meta.get("exit_code")) if meta.get("exit_code") else None,
-                    "result_path": meta.get("result_path"),
-                    "error": meta.get("error"),
-                    "params": params
-                }
-                # upsert job metadata into DuckDB
-                upsert_job(job_record)
-                # now sync logs for this job
-                _sync_logs_for_job(job_id)
-            except Exception:
-                # ignore per-job failures to keep the loop resilient
-                continue
-    except Exception:
-        # top-level ignore to keep loop alive
-        pass
+def _job_record(job_id, meta):
+    # params is already serialized JSON in the hash; upsert_job stores the string as is
+    params = meta.get("params") or None
+    return {
+        "id": job_id,
+        "status": meta.get("status"),
+        "created_at": int(meta.get("created_at")) if meta.get("created_at") else None,
+        "started_at": int(meta.get("started_at")) if meta.get("started_at") else None,
+        "finished_at": int(meta.get("finished_at")) if meta.get("finished_at") else None,
+        "exit_code": int(meta.get("exit_code")) if meta.get("exit_code") else None,
+        "result_path": meta.get("result_path"),
+        "error": meta.get("error"),
+        "params": params
+    }
 
-def _sync_logs_for_job(job_id: str):
-    log_key = JOB_LOG_PREFIX + job_id
-    sync_key = JOB_LOG_SYNC_PREFIX + job_id
-    # get next index to read (defaults to 0)
-    last_idx_val = _r.get(sync_key)
-    last_idx = int(last_idx_val) if last_idx_val and last_idx_val.isdigit() else 0
-    # get list length
+def _load_summary_from_result_path(result_path):
+    """
+    Load the simulator result JSON and extract the summary metrics persisted with the job.
+    Returns a dict of typed metrics, or None if the file can't be read.
+    Expected structure in result JSON:
+      {
+        "stats": {
+          "avg_cores": ...,
+          "avg_mem_bytes": ...,
+          "disk_growth_bytes": ...,
+          "per_session_cores": ...,
+          "per_session_mem_bytes": ...,
+          ...
+        },
+        "estimates": {...}
+      }
+    """
+    if not result_path or not os.path.exists(result_path):
+        return None
     try:
-        llen = _r.llen(log_key)
-    except Exception:
-        llen = 0
-    if llen <= last_idx:
-        return  # nothing new
-    # fetch new entries (up to batch limit)
-    end_idx = min(llen - 1, last_idx + LOG_BATCH_LIMIT - 1)
-    try:
-        new_entries = _r.lrange(log_key, last_idx, end_idx)
+        with open(result_path, "rb") as fh:
+            # stream just the "stats" object; parsing stops there instead of
+            # materializing the rest of the file
+            stats = next(ijson.items(fh, "stats", use_float=True), None) or {}
+    except ijson.JSONError:
+        try:
+            with open(result_path, "rb") as fh:
+                stats = orjson.loads(fh.read()).get("stats") or {}
+        except Exception:
+            return None
     except Exception:
-        new_entries = []
-    if not new_entries:
-        return
-    # prepare rows: (seq, ts, line)
+        return None
+    if not isinstance(stats, dict):
+        stats = {}
+    summary = {}
+    for key, cast in (("avg_cores", float), ("avg_mem_bytes", int), ("disk_growth_bytes", int),
+                      ("per_session_cores", float), ("per_session_mem_bytes", int)):
+        try:
+            summary[key] = cast(stats.get(key) or 0)
+        except Exception:
+            summary[key] = cast(0)
+    return summary
+
+def _upsert_jobs(job_ids, replies, changed=None):
+    """
+    Upsert the job hashes read by _sync_jobs into DuckDB (only those in changed, if given;
+    the rest are just parsed). Blocking (DuckDB, result files): runs in a worker thread.
+    Returns (jobs, gone) with jobs as (job_id, job_record, last_idx).
+    """
+    jobs = []
+    gone = []
+    for n, job_id in enumerate(job_ids):
+        meta, last_idx_val = replies[2 * n:2 * n + 2]
+        if isinstance(meta, Exception):
+            continue
+        if not meta:
+            # hash is gone, nothing left to sync
+            gone.append(job_id)
+            continue
+        try:
+            job_record = _job_record(job_id, meta)
+            # parse the result file once, when the job is first seen finished
+            if (job_record["status"] in TERMINAL_STATUSES and job_record["result_path"]
+                    and job_id not in _summarized and (changed is None or job_id in changed)):
+                summary = _load_summary_from_result_path(job_record["result_path"])
+                if summary:
+                    job_record.update(summary)
+                    _summarized.add(job_id)
+            # upsert job metadata into DuckDB
+            if changed is None or job_id in changed:
+                upsert_job(job_record)
+        except Exception:
+            # ignore per-job failures to keep the loop resilient
+            continue
+        last_idx = int(last_idx_val) if isinstance(last_idx_val, str) and last_idx_val.isdigit() else 0
+        jobs.append((job_id, job_record, last_idx))
+    return jobs, gone
+
+async def _sync_jobs(job_ids, changed=None):
+    """
+    Sync job metadata and new log lines for a batch of job ids. Only jobs in changed (a
+    set of ids whose hash changed; None means all) are upserted into DuckDB, the others
+    only get their log lines synced.
+    """
+    # 1) hash and log sync pointer of every job in one round-trip
+    pipe = _r.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(JOB_HASH_PREFIX + job_id)
+        pipe.get(JOB_LOG_SYNC_PREFIX + job_id)
+    replies = await pipe.execute(raise_on_error=False)
+
+    # 2) upsert metadata; DuckDB runs off the event loop so the log listener keeps
+    # streaming meanwhile
+    jobs, gone = await asyncio.to_thread(_upsert_jobs, job_ids, replies, changed)
+
+    # 3) fetch new entries (up to batch limit per job) in one round-trip; count, length
+    # and range of each job come from one atomic script call
+    entries = {}
+    if jobs:
+        pipe = _r.pipeline(transaction=False)
+        for job_id, _, last_idx in jobs:
+            await _READ_LOG_SCRIPT(keys=[JOB_LOG_PREFIX + job_id, JOB_LOG_COUNT_PREFIX + job_id],
+                                   args=[last_idx, LOG_BATCH_LIMIT], client=pipe)
+        for (job_id, _, _), reply in zip(jobs, await pipe.execute(raise_on_error=False)):
+            if not isinstance(reply, Exception):
+                entries[job_id] = (int(reply[0]), int(reply[1]), reply[2])
+
+    # 4) persist every job's lines in one insert, then advance pointers / drop finished
+    # jobs in one round-trip
     ts = _now_ts()
+    # rows: (job_id, seq, ts, line) with seq the absolute line number
     rows = []
-    for i, line in enumerate(new_entries):
-        seq = last_idx + i
-        rows.append((seq, ts, line))
-    # insert into DuckDB
+    for job_id, (_, start, lines) in entries.items():
+        rows.extend((job_id, start + i, ts, line) for i, line in enumerate(lines))
     try:
-        inserted = insert_job_logs(job_id, rows)
+        await asyncio.to_thread(insert_job_logs_bulk, rows)
     except Exception:
-        inserted = 0
-    # advance sync pointer irrespective of insert count to avoid reprocessing duplicates repeatedly
-    next_idx = last_idx + len(new_entries)
+        pass
+
+    pipe = _r.pipeline(transaction=False)
+    for job_id in gone:
+        pipe.srem(JOB_INDEX_KEY, job_id)
+        _summarized.discard(job_id)
+    for job_id, job_record, last_idx in jobs:
+        if job_id not in entries:
+            continue
+        total, start, lines = entries[job_id]
+        # advance sync pointer irrespective of insert count to avoid reprocessing duplicates
+        # repeatedly (also past lines that were trimmed before we got to them)
+        if start + len(lines) != last_idx:
+            last_idx = start + len(lines)
+            pipe.set(JOB_LOG_SYNC_PREFIX + job_id, str(last_idx))
+        # finished and fully persisted: stop tracking it
+        finished_at = job_record["finished_at"]
+        if (job_record["status"] in TERMINAL_STATUSES and last_idx >= total
+                and finished_at and ts - finished_at >= JOB_INDEX_GRACE):
+            pipe.srem(JOB_INDEX_KEY, job_id)
+            _summarized.discard(job_id)
+    await pipe.execute(raise_on_error=False)
+
+async def _sync_jobs_and_logs_once():
     try:
-        _r.set(sync_key, str(next_idx))
+        # only jobs in the index: bounded lookup instead of a KEYS scan of the keyspace
+        job_ids = list(await _r.smembers(JOB_INDEX_KEY))
+        for i in range(0, len(job_ids), PIPELINE_CHUNK):
+            try:
+                await _sync_jobs(job_ids[i:i + PIPELINE_CHUNK])
+            except Exception:
+                # keep going with the next batch
+                continue
     except Exception:
+        # top-level ignore to keep loop alive
         pass
 
-def _scan_and_sync():
-    global _running
+async def _enable_keyspace_events() -> bool:
+    """Make sure Redis publishes keyspace events for hashes and lists; False if we can't."""
+    try:
+        flags = (await _r.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+        # "A" is an alias that already includes hash (h) and list (l) events
+        missing = "".join(c for c in "Khl" if c not in flags and not (c != "K" and "A" in flags))
+        if missing:
+            await _r.config_set("notify-keyspace-events", flags + missing)
+        return True
+    except Exception:
+        return False
+
+async def _poll_and_sync():
     while _running:
+        await _sync_jobs_and_logs_once()
+        await asyncio.sleep(SYNC_INTERVAL)
+
+async def _listen_and_sync():
+    channel_prefix = f"__keyspace@{REDIS_DB}__:"
+    ps = _r.pubsub(ignore_subscribe_messages=True)
+    await ps.psubscribe(channel_prefix + JOB_HASH_PREFIX + "*", channel_prefix + JOB_LOG_PREFIX + "*")
+    try:
+        # catch up on anything that changed before we subscribed
+        await _sync_jobs_and_logs_once()
+        last_full = time.time()
+        # log appends arrive with every worker flush (~20/s per running job): their jobs are
+        # collected here and synced at most once per SYNC_INTERVAL, like the poll did
+        log_dirty = set()
+        last_log_sync = time.time()
+        while _running:
+            hash_dirty = set()
+            message = await ps.get_message(timeout=SYNC_INTERVAL)
+            # coalesce a burst of events (e.g. many RPUSHes) into one batched sync
+            while message and len(hash_dirty) + len(log_dirty) < PIPELINE_CHUNK:
+                key = message["channel"][len(channel_prefix):]
+                if key.startswith(JOB_HASH_PREFIX):
+                    hash_dirty.add(key[len(JOB_HASH_PREFIX):])
+                elif key.startswith(JOB_LOG_PREFIX):
+                    log_dirty.add(key[len(JOB_LOG_PREFIX):])
+                message = await ps.get_message()
+            # hash changes (status, results) are synced right away, with their new lines
+            if hash_dirty:
+                log_dirty -= hash_dirty
+                try:
+                    await _sync_jobs(list(hash_dirty), hash_dirty)
+                except Exception:
+                    pass
+            if log_dirty and time.time() - last_log_sync >= SYNC_INTERVAL:
+                try:
+                    await _sync_jobs(list(log_dirty), set())
+                except Exception:
+                    pass
+                log_dirty.clear()
+                last_log_sync = time.time()
+            if time.time() - last_full >= FULL_SYNC_INTERVAL:
+                await _sync_jobs_and_logs_once()
+                last_full = time.time()
+    finally:
         try:
-            _sync_jobs_and_logs_once()
+            await ps.reset()
         except Exception:
             pass
-        time.sleep(SYNC_INTERVAL)
+
+async def _scan_and_sync():
+    # one-off backfill first, then sync until stopped
+    await _backfill_job_index()
+    while _running:
+        try:
+            if await _enable_keyspace_events():
+                await _listen_and_sync()
+            else:
+                # no notifications (e.g. CONFIG disabled on a managed Redis)
+                await _poll_and_sync()
+        except Exception:
+            # lost the connection: back off, then resubscribe
+            await asyncio.sleep(SYNC_INTERVAL)
+
+async def _backfill_job_index():
+    # one-off SCAN so jobs created before the index existed are synced (and then aged out)
+    try:
+        job_ids = [k[len(JOB_HASH_PREFIX):] async for k in _r.scan_iter(match=JOB_HASH_PREFIX + "*", count=1000)]
+        for i in range(0, len(job_ids), PIPELINE_CHUNK):
+            await _r.sadd(JOB_INDEX_KEY, *job_ids[i:i + PIPELINE_CHUNK])
+    except Exception:
+        pass
 
 def start_db_sync():
-    global _thread, _running
-    if _thread and _thread.is_alive():
+    global _future, _running
+    if _future and not _future.done():
         return
     _running = True
-    _thread = threading.Thread(target=_scan_and_sync, daemon=True)
-    _thread.start()
+    _future = submit(_scan_and_sync())
 
 def stop_db_sync():
     global _running
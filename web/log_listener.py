@@ -1,12 +1,10 @@
-import threading
-import json
-import time
-import os
-import redis
+import orjson
+from redis_loop import get_async_redis, submit
 
 # This module subscribes to the Redis pubsub channel 'bench_logs' and
 # forwards messages to the Flask-SocketIO server via a callback that the
-# web app registers at startup.
+# web app registers at startup. The subscriber runs as a coroutine on the
+# shared Redis event loop (see redis_loop).
 #
 # Usage:
 #   from log_listener import start_redis_listener, stop_redis_listener, register_emit_callback
@@ -15,30 +13,27 @@ import redis
 #
 # The emit callback will be called with two args: (job_id, line)
 
-REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_DB = int(os.getenv("REDIS_DB", 0))
-
 _channel = "bench_logs"
-_r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
-_thread = None
+_r = get_async_redis()
+_future = None
 _running = False
 _emit_cb = None
 
 def register_emit_callback(cb):
     """
-    cb should be a callable like cb(job_id: str, line: str)
+    cb should be a callable like cb(job_id: str, line: str); it is called on the
+    Redis event loop, so it must not block
     """
     global _emit_cb
     _emit_cb = cb
 
-def _listener_loop():
+async def _listener_loop():
     global _running
     ps = _r.pubsub()
-    ps.subscribe(_channel)
+    await ps.subscribe(_channel)
     _running = True
     try:
-        for message in ps.listen():
+        async for message in ps.listen():
             # message example: {'type': 'message', 'pattern': None, 'channel': 'bench_logs', 'data': '{"job_id": "...", "line": "..."}'}
             if not _running:
                 break
@@ -50,7 +45,7 @@ def _listener_loop():
             if not data:
                 continue
             try:
-                payload = json.loads(data)
+                payload = orjson.loads(data)
                 job_id = payload.get("job_id")
                 line = payload.get("line")
                 if _emit_cb and job_id and line is not None:
@@ -63,17 +58,16 @@ def _listener_loop():
                 pass
     finally:
         try:
-            ps.close()
+            await ps.reset()
         except Exception:
             pass
         _running = False
 
 def start_redis_listener():
-    global _thread
-    if _thread and _thread.is_alive():
+    global _future
+    if _future and not _future.done():
         return
-    _thread = threading.Thread(target=_listener_loop, daemon=True)
-    _thread.start()
+    _future = submit(_listener_loop())
 
 def stop_redis_listener():
     global _running
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import redis.asyncio as aioredis
+from redis_pool import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_MAX_CONNECTIONS
+
+# One asyncio event loop, on a single daemon thread, for the web process's long-running
+# Redis consumers (db_sync, log_listener). They run as coroutines on it instead of each
+# blocking its own thread on Redis round-trips.
+#
+# Usage:
+#   from redis_loop import submit, get_async_redis
+#   _r = get_async_redis()
+#   submit(some_coroutine())
+
+_loop = None
+_loop_lock = threading.Lock()
+_pool = None
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+def get_loop():
+    """The shared loop, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_loop, args=(_loop,), daemon=True, name="redis-loop").start()
+    return _loop
+
+def get_async_redis():
+    """asyncio client for coroutines on the shared loop; all of them share one pool."""
+    global _pool
+    with _loop_lock:
+        if _pool is None:
+            _pool = aioredis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+                                            decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS)
+    return aioredis.Redis(connection_pool=_pool)
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop (thread-safe); returns a concurrent Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
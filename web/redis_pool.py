@@ -0,0 +1,22 @@
+import os
+import redis
+from redis.utils import HIREDIS_AVAILABLE
+
+# Redis settings for the web process, and the synchronous connection pool used by
+# bench_runner (the request path). db_sync and log_listener run on the asyncio loop
+# in redis_loop, which has its own pool built from these settings.
+# redis-py parses replies with the hiredis C parser whenever it is installed.
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+if not HIREDIS_AVAILABLE:
+    print("redis: hiredis not installed, falling back to the pure-Python reply parser")
+
+pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+                            decode_responses=True, max_connections=REDIS_MAX_CONNECTIONS)
+
+def get_redis():
+    """Synchronous client backed by the pool."""
+    return redis.Redis(connection_pool=pool)
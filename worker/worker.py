@@ -1,6 +1,5 @@
 import os
 import asyncio
-import base64
 import json
 from playwright.async_api import async_playwright
 import socketio
@@ -15,6 +14,17 @@ sio = socketio.AsyncClient()
 # Keep per-session state
 SESSIONS = {}
 
+# One Chromium per worker (see get_browser); each session only gets its own context
+PLAYWRIGHT = None
+BROWSER = None
+_browser_lock = asyncio.Lock()
+# cap on simultaneously open session contexts (extra sessions wait for a slot)
+MAX_CONTEXTS = int(os.getenv("WORKER_MAX_CONTEXTS", "8"))
+_context_slots = asyncio.Semaphore(MAX_CONTEXTS)
+
+# Frames are JPEG (much smaller and cheaper to encode than PNG); quality 1-100
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "60"))
+
 @sio.event
 async def connect():
     print("Worker connected to server")
@@ -67,42 +77,61 @@ async def on_event(data):
         print("Error performing action:", e)
         # capture screenshot on action error
         try:
-            data = await page.screenshot(type='png')
-            b64 = base64.b64encode(data).decode()
-            await sio.emit("frame", {"session_id": session_id, "data": b64, "error": str(e)})
+            data = await capture_frame(page)
+            await sio.emit("frame", {"session_id": session_id, "data": data, "error": str(e)})
         except Exception:
             pass
 
+async def capture_frame(page):
+    # viewport only, with CSS animations/transitions fast-forwarded so the capture doesn't wait on them
+    return await page.screenshot(type="jpeg", quality=JPEG_QUALITY, full_page=False, animations="disabled")
+
+async def get_browser():
+    """The shared browser, (re)launched if it isn't running or has crashed/disconnected."""
+    global BROWSER
+    async with _browser_lock:
+        if BROWSER is None or not BROWSER.is_connected():
+            if BROWSER is not None:
+                print("Browser disconnected, relaunching")
+                try:
+                    await BROWSER.close()
+                except Exception:
+                    pass
+            BROWSER = await PLAYWRIGHT.chromium.launch(headless=True)
+    return BROWSER
+
 async def run_session(session_id, url, viewport):
     print(f"Starting session {session_id} -> {url}")
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
+        async with _context_slots:
+            browser = await get_browser()
             context = await browser.new_context(viewport=viewport)
-            page = await context.new_page()
-            SESSIONS[session_id]["page"] = page
+            try:
+                page = await context.new_page()
+                SESSIONS[session_id]["page"] = page
 
-            # Hook console errors
-            page.on("console", lambda msg: print(f"[console][{session_id}]", msg.type, msg.text))
-            page.on("pageerror", lambda exc: asyncio.create_task(handle_page_error(session_id, exc, page)))
+                # Hook console errors
+                page.on("console", lambda msg: print(f"[console][{session_id}]", msg.type, msg.text))
+                page.on("pageerror", lambda exc: asyncio.create_task(handle_page_error(session_id, exc, page)))
 
-            await page.goto(url, timeout=45000)
-            # Periodically screenshot and send frames
-            while True:
-                try:
-                    data = await page.screenshot(type="png")
-                    b64 = base64.b64encode(data).decode()
-                    await sio.emit("frame", {"session_id": session_id, "data": b64})
-                except Exception as e:
-                    print("screenshot error:", e)
-                    # send an error payload with screenshot if possible
+                await page.goto(url, timeout=45000)
+                # Periodically screenshot and send frames
+                while True:
                     try:
-                        data = await page.screenshot(type="png")
-                        b64 = base64.b64encode(data).decode()
-                        await sio.emit("frame", {"session_id": session_id, "data": b64, "error": str(e)})
-                    except Exception:
-                        pass
-                await asyncio.sleep(1)  # 1 fps default; adjust as needed
+                        data = await capture_frame(page)
+                        # raw bytes go out as a Socket.IO binary attachment, no base64 step
+                        await sio.emit("frame", {"session_id": session_id, "data": data})
+                    except Exception as e:
+                        print("screenshot error:", e)
+                        # send an error payload with screenshot if possible
+                        try:
+                            data = await capture_frame(page)
+                            await sio.emit("frame", {"session_id": session_id, "data": data, "error": str(e)})
+                        except Exception:
+                            pass
+                    await asyncio.sleep(1)  # 1 fps default; adjust as needed
+            finally:
+                await context.close()
     except Exception as e:
         print("Session failed:", e)
     finally:
@@ -112,15 +141,21 @@ async def run_session(session_id, url, viewport):
 async def handle_page_error(session_id, exc, page):
     print("Page error:", exc)
     try:
-        data = await page.screenshot(type='png')
-        b64 = base64.b64encode(data).decode()
-        await sio.emit("frame", {"session_id": session_id, "data": b64, "error": str(exc)})
+        data = await capture_frame(page)
+        await sio.emit("frame", {"session_id": session_id, "data": data, "error": str(exc)})
     except Exception as e:
         print("failed screenshot on page error:", e)
 
 async def main():
-    await sio.connect(SOCKETIO_SERVER, transports=["websocket"], socketio_path="/socket.io", query={"role":"worker"})
-    await sio.wait()
+    global PLAYWRIGHT
+    PLAYWRIGHT = await async_playwright().start()
+    await get_browser()
+    try:
+        await sio.connect(SOCKETIO_SERVER, transports=["websocket"], socketio_path="/socket.io", query={"role":"worker"})
+        await sio.wait()
+    finally:
+        await BROWSER.close()
+        await PLAYWRIGHT.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file